@@ -1,19 +1,71 @@
 from typing import Dict, Any, List
 from app.utils import extract_functions, find_todos_and_prints, compute_source_hash
+import asyncio
 import subprocess
 import json
 import tempfile
 import os
 
+# Stages run in order for every review. Each one only needs the source, so a
+# review cut short by a budget can still report the stages that finished.
+STAGES = ("functions", "todos", "lint")
+
+# Stages that only need ast/radon; used for the instant first phase of mode=fast.
+FAST_STAGES = ("functions", "todos")
+
+# Errors that mean a stage ran out of time/memory/stack rather than a bug in the input handling.
+BUDGET_ERRORS = (MemoryError, RecursionError, subprocess.TimeoutExpired)
+
+RUFF_TIMEOUT = float(os.getenv("RUFF_TIMEOUT", "10"))
+
+LINT_SUGGESTION = "Fix the reported linting issues (ruff) to improve code quality."
+NO_FUNCTIONS_SUGGESTION = "No functions detected — consider modularizing code into functions for testability and reuse."
+
+
 class CodeReviewAgent:
     """Performs a lightweight code review and returns structured results.
        Also runs ruff (if available) and collects its results.
     """
 
     def review_code(self, source: str) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        reasons: List[str] = []
+        for stage, result, reason in self.iter_stages(source):
+            if reason:
+                reasons.append(reason)
+            else:
+                results[stage] = result
+        return self.build_review(source, results, "; ".join(reasons) or None)
+
+    def iter_stages(self, source: str, stages=STAGES):
+        """Yield (stage, result, reason) for each stage as it finishes.
+           reason is set instead of result when the stage blew a budget.
+        """
+        runners = {
+            "functions": extract_functions,
+            "todos": find_todos_and_prints,
+            "lint": self._run_ruff_on_source,
+        }
+        for stage in stages:
+            try:
+                yield stage, runners[stage](source), None
+            except BUDGET_ERRORS as e:
+                yield stage, None, self._budget_reason(stage, e)
+
+    def build_review(
+        self, source: str, results: Dict[str, Any], partial_reason: str | None = None, stages=STAGES
+    ) -> Dict[str, Any]:
+        """Assemble the review from per-stage results.
+           Requested stages that are missing are reported as partial; stages not requested are pending.
+        """
         source_hash = compute_source_hash(source)
-        functions = extract_functions(source)
-        todos = find_todos_and_prints(source)
+        functions = results.get("functions") or []
+        todos = results.get("todos") or []
+        lint_findings = results.get("lint") or []
+        missing = [s for s in stages if s not in results]
+        pending = [s for s in STAGES if s not in stages]
+        if missing and not partial_reason:
+            partial_reason = f"stages not completed: {', '.join(missing)}"
 
         findings: List[Dict[str, Any]] = []
         suggestions: List[str] = []
@@ -35,36 +87,84 @@ class CodeReviewAgent:
             findings.append({"lineno": lineno, "message": msg})
             suggestions.append(f"Address at line {lineno}: '{msg}'. Consider creating a tracked issue instead of leaving TODOs.")
 
-        # Run ruff (if installed) and include lint findings
-        lint_findings = self._run_ruff_on_source(source)
+        # Include ruff lint findings (if ruff was installed)
         if lint_findings:
             findings.append({"linter": "ruff", "issues": lint_findings})
-            suggestions.append("Fix the reported linting issues (ruff) to improve code quality.")
+            suggestions.append(LINT_SUGGESTION)
 
-        if not functions:
-            suggestions.append("No functions detected — consider modularizing code into functions for testability and reuse.")
+        if not functions and "functions" in results:
+            suggestions.append(NO_FUNCTIONS_SUGGESTION)
 
-        summary = self._build_summary(functions, todos, lint_findings)
+        summary = self._build_summary([f.complexity for f in functions], len(todos) + len(lint_findings))
+        if missing:
+            summary += f" Partial review: {partial_reason}."
+        if pending:
+            summary += f" Pending: {', '.join(pending)}."
         return {
             "source_hash": source_hash,
             "summary": summary,
             "findings": findings,
             "suggestions": suggestions,
+            "partial": bool(missing),
+            "partial_reason": partial_reason if missing else None,
+            "pending_stages": pending,
         }
 
-    def _build_summary(self, functions, todos, lint_findings):
-        n_funcs = len(functions)
-        avg_complexity = sum((f.complexity for f in functions), 0) / n_funcs if n_funcs else 0
-        n_issues = len(todos) + (len(lint_findings) if lint_findings else 0)
+    def merge_stages(
+        self, review: Dict[str, Any], results: Dict[str, Any], partial_reason: str | None = None, stages=("lint",)
+    ) -> Dict[str, Any]:
+        """Fold deferred stage results into a stored review (findings/suggestions/summary/partial).
+           Only "lint" is ever deferred; the other stages' findings are already in the review.
+        """
+        findings = list(review["findings"])
+        suggestions = list(review["suggestions"])
+        lint_findings = results.get("lint") or []
+        if lint_findings:
+            findings.append({"linter": "ruff", "issues": lint_findings})
+            # same position as in a full review: before the closing "no functions" hint
+            at = suggestions.index(NO_FUNCTIONS_SUGGESTION) if NO_FUNCTIONS_SUGGESTION in suggestions else len(suggestions)
+            suggestions.insert(at, LINT_SUGGESTION)
+
+        missing = [s for s in stages if s not in results]
+        if missing and not partial_reason:
+            partial_reason = f"stages not completed: {', '.join(missing)}"
+        reasons = [r for r in (review.get("partial_reason"), partial_reason if missing else None) if r]
+        partial_reason = "; ".join(reasons) or None
+
+        complexities = [f["complexity"] for f in findings if "name" in f]
+        n_issues = sum(1 for f in findings if "message" in f and "name" not in f) + len(lint_findings)
+        summary = self._build_summary(complexities, n_issues)
+        if partial_reason:
+            summary += f" Partial review: {partial_reason}."
+        return {
+            **review,
+            "summary": summary,
+            "findings": findings,
+            "suggestions": suggestions,
+            "partial": bool(partial_reason),
+            "partial_reason": partial_reason,
+            "pending_stages": [s for s in review.get("pending_stages") or [] if s not in stages],
+        }
+
+    def _budget_reason(self, stage: str, exc: BaseException) -> str:
+        if isinstance(exc, MemoryError):
+            return f"memory budget exceeded during {stage}"
+        if isinstance(exc, RecursionError):
+            return f"input too deeply nested for {stage}"
+        return f"{stage} timed out after {exc.timeout}s"
+
+    def _build_summary(self, complexities: List[int], n_issues: int):
+        n_funcs = len(complexities)
+        avg_complexity = sum(complexities, 0) / n_funcs if n_funcs else 0
         return f"Analyzed {n_funcs} functions, avg complexity {avg_complexity:.2f}, {n_issues} TODO/print/lint findings."
 
     def _run_ruff_on_source(self, source: str) -> List[Dict[str, Any]]:
         """Run ruff programmatically by writing to a temp file and calling ruff check --format json.
-           If ruff isn't available, return [].
+           If ruff isn't available, return []. Raises subprocess.TimeoutExpired past RUFF_TIMEOUT.
         """
         try:
             # Ensure ruff is installed on PATH
-            res = subprocess.run(["ruff", "--version"], capture_output=True, text=True)
+            res = subprocess.run(["ruff", "--version"], capture_output=True, text=True, timeout=RUFF_TIMEOUT)
             if res.returncode != 0:
                 return []
         except FileNotFoundError:
@@ -77,23 +177,11 @@ class CodeReviewAgent:
             tmp_path = tf.name
 
         try:
-            proc = subprocess.run(["ruff", "check", tmp_path, "--format", "json"], capture_output=True, text=True)
+            proc = subprocess.run(
+                ["ruff", "check", tmp_path, "--format", "json"], capture_output=True, text=True, timeout=RUFF_TIMEOUT
+            )
             if proc.returncode in (0, 1):  # 0 = no issues, 1 = issues found
-                try:
-                    parsed = json.loads(proc.stdout)
-                    # parsed is a dict keyed by filename
-                    issues = []
-                    for filename, items in parsed.items():
-                        for it in items:
-                            issues.append({
-                                "code": it.get("code"),
-                                "message": it.get("message"),
-                                "line": it.get("location", {}).get("row"),
-                                "column": it.get("location", {}).get("col"),
-                            })
-                    return issues
-                except Exception:
-                    return []
+                return self._parse_ruff_output(proc.stdout)
         finally:
             try:
                 os.unlink(tmp_path)
@@ -101,3 +189,55 @@ class CodeReviewAgent:
                 pass
 
         return []
+
+    async def arun_ruff_on_source(self, source: str) -> List[Dict[str, Any]]:
+        """Async variant of _run_ruff_on_source: waits on the ruff subprocess without holding a thread."""
+        # file I/O is blocking; keep it off the loop
+        tmp_path = await asyncio.to_thread(_write_temp_source, source)
+
+        try:
+            try:
+                proc = await asyncio.create_subprocess_exec(
+                    "ruff", "check", tmp_path, "--format", "json",
+                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                )
+            except FileNotFoundError:
+                return []
+            try:
+                stdout, _ = await asyncio.wait_for(proc.communicate(), RUFF_TIMEOUT)
+            except asyncio.TimeoutError:
+                proc.kill()
+                await proc.wait()
+                raise subprocess.TimeoutExpired("ruff", RUFF_TIMEOUT)
+            if proc.returncode in (0, 1):
+                return self._parse_ruff_output(stdout.decode("utf-8", errors="replace"))
+        finally:
+            try:
+                os.unlink(tmp_path)
+            except Exception:
+                pass
+
+        return []
+
+    def _parse_ruff_output(self, stdout: str) -> List[Dict[str, Any]]:
+        try:
+            parsed = json.loads(stdout)
+            # older ruff: dict keyed by filename; current ruff: flat list of messages
+            items = [it for its in parsed.values() for it in its] if isinstance(parsed, dict) else parsed
+            return [
+                {
+                    "code": it.get("code"),
+                    "message": it.get("message"),
+                    "line": it.get("location", {}).get("row"),
+                    "column": it.get("location", {}).get("column", it.get("location", {}).get("col")),
+                }
+                for it in items
+            ]
+        except Exception:
+            return []
+
+
+def _write_temp_source(source: str) -> str:
+    with tempfile.NamedTemporaryFile(suffix=".py", delete=False, mode="w", encoding="utf-8") as tf:
+        tf.write(source)
+        return tf.name
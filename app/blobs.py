@@ -0,0 +1,173 @@
+# app/blobs.py
+"""
+Content-addressed storage for large state values (sources, reviews).
+
+A value is stored once in the blobs table keyed by its sha256 and run state
+holds a reference {"$blob": "<sha256>"} in its place. Strings are keyed by
+compute_source_hash(value), so a review's source_hash doubles as the
+reference to its source; other values are keyed by the hash of their JSON in a
+separate, non-overlapping key space.
+
+Every run's references are listed in run_blobs so retention can tell live blobs
+apart with an index lookup, and reusing a blob bumps its last_used_at.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, Set
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.db import SessionLocal
+from app.models import Blob, Run, RunBlob
+from app.utils import compute_source_hash
+
+# state values whose JSON is at least this many bytes are moved into blobs
+BLOB_MIN_BYTES = int(os.getenv("BLOB_MIN_BYTES", "1024"))
+
+REF_KEY = "$blob"
+
+
+def blob_ref(key: str) -> Dict[str, str]:
+    return {REF_KEY: key}
+
+
+def is_ref(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and isinstance(value.get(REF_KEY), str)
+
+
+# Prefix for hashing non-string values. 0xff never occurs in UTF-8, so these
+# keys can't collide with compute_source_hash(some string): one key, one value.
+_JSON_KEY_PREFIX = b"\xffjson:"
+
+
+def _encode(value: Any):
+    if isinstance(value, str):
+        return compute_source_hash(value), json.dumps(value)
+    data = json.dumps(value, sort_keys=True)
+    return hashlib.sha256(_JSON_KEY_PREFIX + data.encode("utf-8")).hexdigest(), data
+
+
+def put_blob(value: Any) -> Dict[str, str]:
+    """Store value (if not already stored) and return a reference to it."""
+    key, data = _encode(value)
+    _store(key, data)
+    return blob_ref(key)
+
+
+def _touch(db, key: str) -> bool:
+    # committed before the caller references the blob, so a retention sweep sees it as recently used
+    found = db.execute(update(Blob).where(Blob.hash == key).values(last_used_at=datetime.utcnow())).rowcount > 0
+    db.commit()
+    return found
+
+
+def _store(key: str, data: str):
+    db = SessionLocal()
+    try:
+        if not _touch(db, key):
+            db.add(Blob(hash=key, data=data, size=len(data)))
+            try:
+                db.commit()
+            except IntegrityError:
+                # stored concurrently by another request; same content either way
+                db.rollback()
+    finally:
+        db.close()
+
+
+def blob_exists(key: str) -> bool:
+    db = SessionLocal()
+    try:
+        return db.get(Blob, key) is not None
+    finally:
+        db.close()
+
+
+def touch_blob(key: str) -> bool:
+    """Mark a blob as used now (before a new run references it). False if it does not exist."""
+    db = SessionLocal()
+    try:
+        return _touch(db, key)
+    finally:
+        db.close()
+
+
+def load_blob(ref_or_key: Any) -> Any:
+    """Return the stored value for a reference or hash. Raises KeyError if missing."""
+    key = ref_or_key[REF_KEY] if is_ref(ref_or_key) else ref_or_key
+    db = SessionLocal()
+    try:
+        blob = db.get(Blob, key)
+        if blob is None:
+            raise KeyError(f"blob {key} not found")
+        return json.loads(blob.data)
+    finally:
+        db.close()
+
+
+def dehydrate(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Replace large top-level values with blob references (existing references pass through)."""
+    out: Dict[str, Any] = {}
+    # dict.items() does not go through BlobState.__getitem__, so unresolved refs stay refs
+    for k, v in dict.items(state):
+        if is_ref(v):
+            out[k] = v
+            continue
+        key, data = _encode(v)
+        if len(data) >= BLOB_MIN_BYTES:
+            _store(key, data)
+            out[k] = blob_ref(key)
+        else:
+            out[k] = v
+    return out
+
+
+def run_blob_keys(state: Dict[str, Any], log: Iterable[Any] = ()) -> Set[str]:
+    """Hashes referenced by a dehydrated run state and its log entries' results."""
+    values = list(dict.values(state))
+    for entry in log:
+        if isinstance(entry, dict) and isinstance(entry.get("result"), dict):
+            values += entry["result"].values()
+    return {v[REF_KEY] for v in values if is_ref(v)}
+
+
+def set_run_blobs(db, run_id: int, keys: Iterable[str]):
+    """Replace the run's rows in run_blobs; commit together with the run's state/log."""
+    db.execute(delete(RunBlob).where(RunBlob.run_id == run_id))
+    db.add_all(RunBlob(run_id=run_id, hash=k) for k in set(keys))
+
+
+def backfill_run_blobs():
+    """Fill run_blobs for runs stored before the table existed (called once by init_db)."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(Run.id, Run.state, Run.log)).all()
+        for run_id, state, log in rows:
+            try:
+                keys = run_blob_keys(json.loads(state or "{}"), json.loads(log or "[]"))
+            except ValueError:
+                continue
+            set_run_blobs(db, run_id, keys)
+        db.commit()
+    finally:
+        db.close()
+
+
+class BlobState(dict):
+    """State dict whose blob references are fetched from the DB on first access."""
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if is_ref(value):
+            value = load_blob(value)
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def resolved(self) -> Dict[str, Any]:
+        return {k: self[k] for k in self}
@@ -1,11 +1,17 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 DB_URL = os.getenv("DATABASE_URL", "sqlite:///./reviews.db")
 
 connect_args = {"check_same_thread": False} if DB_URL.startswith("sqlite") else {}
 engine = create_engine(DB_URL, connect_args=connect_args)
+
+if DB_URL.startswith("sqlite"):
+    @event.listens_for(engine, "connect")
+    def _sqlite_incremental_vacuum(dbapi_conn, _record):
+        # only takes effect on new databases; app.retention can convert existing ones
+        dbapi_conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 Base = declarative_base()
 
@@ -13,4 +19,41 @@ Base = declarative_base()
 def init_db():
     # Import models here to register with Base
     from app.models import Review  # noqa: F401
+    backfill_run_blobs = not inspect(engine).has_table("run_blobs")
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _add_missing_indexes()
+    if backfill_run_blobs:
+        from app.blobs import backfill_run_blobs as backfill
+        backfill()
+
+
+def _add_missing_columns():
+    # create_all() never alters existing tables; add columns introduced since the DB was created
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    arg = column.server_default.arg
+                    ddl += f" DEFAULT {arg.text if hasattr(arg, 'text') else repr(str(arg))}"
+                conn.execute(text(ddl))
+
+
+def _add_missing_indexes():
+    # same as above for indexes added to existing tables (e.g. created_at for retention)
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {ix["name"] for ix in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=conn)
@@ -1,10 +1,28 @@
 # app/engine.py
-from typing import Dict, Any, Callable, List, Optional
-import time
+from typing import Dict, Any, Callable, List, Optional, Generator, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import copy
+import functools
+import inspect
+import math
+import multiprocessing
+import os
+
+# default process-pool size for map nodes
+MAP_WORKERS = int(os.getenv("GRAPH_MAP_WORKERS", str(os.cpu_count() or 2)))
+# threads for sync tools under arun_graph; kept apart from the loop's default
+# executor so blocked tools can't starve other to_thread work (e.g. DB writes)
+TOOL_THREADS = int(os.getenv("GRAPH_TOOL_THREADS", "8"))
+# threads for thread-mode map chunks; separate from TOOL_THREADS so a fan-out
+# blocked on a worker pool can't hold up other runs' sync tools
+MAP_THREADS = int(os.getenv("GRAPH_MAP_THREADS", "8"))
 
 class SimpleEngine:
     """
-    Minimal synchronous graph engine.
+    Minimal graph engine. run_graph is synchronous; arun_graph runs on an
+    event loop and accepts coroutine tools next to sync ones.
     Graph format (example):
     {
       "nodes": {
@@ -25,11 +43,39 @@ class SimpleEngine:
       "start": "extract",
       "max_iterations": 50
     }
+
+    Map nodes apply a tool to every element of a state list instead of to the
+    state itself, in chunks on a process pool. Dict elements are passed as the
+    tool's state; anything else is wrapped as {item_key: element}. Results land
+    in state[into] in input order; a failing element gets {"error": ...}.
+      "review_all": {"map": "code_review", "over": "sources", "into": "reviews",
+                     "item_key": "source", "chunk_size": 4, "max_concurrency": 8,
+                     "executor": "process"}   # or "thread" for unpicklable tools
+    A tool can set a `map_executor` attribute to change its default (e.g. tools
+    that already hand work to their own worker processes use "thread"), and a
+    `map_max_concurrency` attribute to cap chunks in flight (e.g. at the size
+    of the pool it hands work to). Thread-mode chunks run on their own thread
+    pool, not on the executor used for sync tools.
+    If a map worker crashes, every chunk in flight on the pool fails; those
+    chunks are replayed one element at a time so only the crashing element
+    gets {"error": ...}.
     """
 
-    def __init__(self, tools: Dict[str, Callable], max_iterations: int = 50):
+    def __init__(
+        self,
+        tools: Dict[str, Callable],
+        max_iterations: int = 50,
+        executor: Optional[Executor] = None,
+        map_workers: int = MAP_WORKERS,
+    ):
         self.tools = tools
         self.default_max_iterations = max_iterations
+        # executor for sync tools under arun_graph; the engine owns it unless one is passed in
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=TOOL_THREADS, thread_name_prefix="graph-tool")
+        self.map_workers = max(1, map_workers)
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._map_threads: Optional[ThreadPoolExecutor] = None
 
     def run_graph(
         self,
@@ -37,7 +83,72 @@ class SimpleEngine:
         initial_state: Dict[str, Any],
         run_logger: Optional[Callable[[str], None]] = None
     ) -> Dict[str, Any]:
-        state = dict(initial_state or {})
+        steps = self._steps(graph, initial_state, run_logger)
+        call = next(steps)
+        try:
+            while True:
+                fn, arg = call
+                try:
+                    res = fn(arg)
+                    if inspect.isawaitable(res):
+                        # coroutine tool in a sync run: drive it to completion here
+                        res = asyncio.run(_await(res))
+                except Exception as e:
+                    call = steps.throw(e)
+                    continue
+                call = steps.send(res)
+        except StopIteration as done:
+            return done.value
+
+    async def arun_graph(
+        self,
+        graph: Dict[str, Any],
+        initial_state: Dict[str, Any],
+        run_logger: Optional[Callable[[str], Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Async variant of run_graph. Coroutine tools (and loggers) are awaited on
+        the running loop; sync ones are offloaded to self.executor, so many runs
+        can make progress concurrently without a thread each.
+        A lazily loaded state (one with a resolved() method, e.g. BlobState) is
+        loaded on a thread first, so coroutine tools, map nodes and branch
+        conditions never hit the DB from the loop.
+        """
+        loop = asyncio.get_running_loop()
+        if hasattr(initial_state, "resolved"):
+            await asyncio.to_thread(initial_state.resolved)
+        steps = self._steps(graph, initial_state, run_logger)
+        call = next(steps)
+        try:
+            while True:
+                fn, arg = call
+                try:
+                    if inspect.iscoroutinefunction(fn):
+                        res = await fn(arg)
+                    else:
+                        res = await loop.run_in_executor(self.executor, fn, arg)
+                        if inspect.isawaitable(res):
+                            res = await res
+                except Exception as e:
+                    call = steps.throw(e)
+                    continue
+                call = steps.send(res)
+        except StopIteration as done:
+            return done.value
+
+    def _steps(
+        self,
+        graph: Dict[str, Any],
+        initial_state: Dict[str, Any],
+        run_logger: Optional[Callable[[str], Any]] = None
+    ) -> Generator[Tuple[Callable, Any], Any, Dict[str, Any]]:
+        """
+        The graph walk shared by run_graph and arun_graph. Yields (callable, arg)
+        for every tool/logger call and expects the result (or exception) sent
+        back, so the sync and async runners only differ in how they call.
+        """
+        # shallow copy that keeps dict subclasses (e.g. BlobState) intact
+        state = copy.copy(initial_state) if initial_state else {}
         logs: List[Dict[str, Any]] = []
         node_name = graph.get("start")
         edges = graph.get("edges", {})
@@ -55,23 +166,38 @@ class SimpleEngine:
                 break
 
             fn_name = node_def.get("fn")
+            map_name = node_def.get("map")
             # log start
-            msg = f"node:{node_name} fn:{fn_name}"
-            logs.append({"event": "start", "node": node_name, "fn": fn_name, "iteration": iterations})
+            msg = f"node:{node_name} map:{map_name}" if map_name else f"node:{node_name} fn:{fn_name}"
+            logs.append({"event": "start", "node": node_name, "fn": map_name or fn_name, "iteration": iterations})
             if run_logger:
                 try:
-                    run_logger(msg)
+                    yield run_logger, msg
                 except Exception:
                     pass
 
             result = None
             try:
-                if fn_name:
+                if map_name:
+                    tool = self.tools.get(map_name)
+                    if not tool:
+                        raise RuntimeError(f"tool '{map_name}' not found")
+                    over = node_def.get("over", "sources")
+                    items = state.get(over) or []
+                    if not isinstance(items, list):
+                        raise RuntimeError(f"map over '{over}' needs a list, got {type(items).__name__}")
+                    into = node_def.get("into", "results")
+                    results = yield functools.partial(self._amap, tool, node_def), items
+                    state[into] = results
+                    # keep the log small: the results themselves are in state
+                    result = {"into": into, "count": len(results),
+                              "errors": sum(1 for x in results if isinstance(x, dict) and "error" in x)}
+                elif fn_name:
                     tool = self.tools.get(fn_name)
                     if not tool:
                         raise RuntimeError(f"tool '{fn_name}' not found")
                     # tool can accept state dict and may return dict updates
-                    res = tool(state)
+                    res = yield tool, state
                     # normalize result -> must be dict or None
                     if isinstance(res, dict):
                         state.update(res)
@@ -113,3 +239,102 @@ class SimpleEngine:
             node_name = taken_next
 
         return {"state": state, "logs": logs, "iterations": iterations}
+
+    async def _amap(self, tool: Callable, node_def: Dict[str, Any], items: List[Any]) -> List[Any]:
+        """Run tool over items in chunks, at most max_concurrency chunks in flight."""
+        if not items:
+            return []
+        loop = asyncio.get_running_loop()
+        item_key = node_def.get("item_key", "source")
+        chunk_size = node_def.get("chunk_size") or math.ceil(len(items) / (self.map_workers * 4))
+        max_concurrency = node_def.get("max_concurrency") or self.map_workers
+        semaphore = asyncio.Semaphore(min(max_concurrency, getattr(tool, "map_max_concurrency", max_concurrency)))
+        use_processes = node_def.get("executor", getattr(tool, "map_executor", "process")) == "process"
+
+        async def run_chunk(chunk):
+            async with semaphore:
+                executor = self._map_pool() if use_processes else self._map_thread_pool()
+                try:
+                    return await loop.run_in_executor(executor, _apply_chunk, tool, chunk, item_key)
+                except BrokenProcessPool:
+                    # a dead worker fails every future on the pool, not just its own chunk:
+                    # start a fresh pool for the others and replay this chunk element by element
+                    self._reset_map_pool(executor)
+                    return await self._isolate_chunk(tool, chunk, item_key)
+                except Exception as e:
+                    # e.g. the tool or an element can't be pickled
+                    return [{"error": str(e)} for _ in chunk]
+
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        done = await asyncio.gather(*(run_chunk(c) for c in chunks))
+        return [r for chunk_results in done for r in chunk_results]
+
+    async def _isolate_chunk(self, tool: Callable, items: List[Any], item_key: str) -> List[Any]:
+        """Run items one at a time on a private one-worker pool; only an item that kills it gets an error."""
+        loop = asyncio.get_running_loop()
+        results: List[Any] = []
+        pool: Optional[ProcessPoolExecutor] = None
+        try:
+            for item in items:
+                pool = pool or _spawn_pool(1)
+                try:
+                    results += await loop.run_in_executor(pool, _apply_chunk, tool, [item], item_key)
+                except BrokenProcessPool as e:
+                    pool.shutdown(wait=False)
+                    pool = None
+                    results.append({"error": f"map worker crashed: {e}"})
+                except Exception as e:
+                    results.append({"error": str(e)})
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False)
+        return results
+
+    def _map_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = _spawn_pool(self.map_workers)
+        return self._process_pool
+
+    def _map_thread_pool(self) -> ThreadPoolExecutor:
+        if self._map_threads is None:
+            self._map_threads = ThreadPoolExecutor(max_workers=MAP_THREADS, thread_name_prefix="graph-map")
+        return self._map_threads
+
+    def _reset_map_pool(self, broken: Executor):
+        if self._process_pool is broken:
+            self._process_pool = None
+            broken.shutdown(wait=False)
+
+    def shutdown(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        if self._map_threads is not None:
+            self._map_threads.shutdown(wait=False, cancel_futures=True)
+            self._map_threads = None
+        if self._owns_executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _spawn_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn (not fork): the server process has threads we must not fork
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def _apply_chunk(tool: Callable, items: List[Any], item_key: str) -> List[Any]:
+    # runs inside a map worker; errors are kept per element instead of failing the chunk
+    results = []
+    for item in items:
+        state = dict(item) if isinstance(item, dict) else {item_key: item}
+        try:
+            res = tool(state)
+            if inspect.isawaitable(res):
+                res = asyncio.run(_await(res))
+            results.append(res)
+        except Exception as e:
+            results.append({"error": str(e)})
+    return results
+
+
+async def _await(awaitable):
+    return await awaitable
@@ -1,26 +1,35 @@
 # app/graphs.py
+import asyncio
 import json
-import threading
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+import logging
+from typing import Literal
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from datetime import datetime
 
 from app.db import SessionLocal
 from app.models import Graph, Run
 from app.engine import SimpleEngine
-from app.agent import CodeReviewAgent
+from app.worker import review_pool
+from app.blobs import BlobState, blob_ref, dehydrate, load_blob, run_blob_keys, set_run_blobs, touch_blob
 from app.utils import extract_functions, find_todos_and_prints, compute_source_hash
-from app.schemas import GraphCreate, GraphOut, GraphRunRequest, RunStateOut
+from app.schemas import GraphCreate, GraphOut, GraphRunRequest, RunStateOut, BlobOut, PageOut
+from app.listing import parse_fields, list_page, export_ndjson, json_text
 
 router = APIRouter(prefix="/graph", tags=["graph"])
+logger = logging.getLogger(__name__)
 
 # Tool registry: wrap existing functions to accept/return state dicts
-agent = CodeReviewAgent()
-
 def _tool_code_review(state: dict):
-    # expects state["source"]
+    # expects state["source"]; runs in a budgeted worker, may come back partial
     source = state.get("source", "")
-    return {"review": agent.review_code(source)}
+    return {"review": review_pool.review(source)}
+
+# already runs in the shared, budgeted review_pool: map nodes should feed that pool
+# from threads instead of adding a second process hop (and a second pool per map worker)
+_tool_code_review.map_executor = "thread"
+# more chunks in flight than review workers would only park threads on the pool's queue
+_tool_code_review.map_max_concurrency = review_pool.workers
 
 def _tool_extract(state: dict):
     source = state.get("source", "")
@@ -33,15 +42,25 @@ def _tool_find_todos(state: dict):
     todos = find_todos_and_prints(source)
     return {"todos": todos}
 
-# register tools
+async def _tool_lint(state: dict):
+    # coroutine tool: waits on ruff without tying up a thread
+    source = state.get("source", "")
+    return {"lint": await review_pool.agent.arun_ruff_on_source(source)}
+
+# register tools (sync or async; async tools are awaited directly by arun_graph)
 TOOLS = {
     "code_review": _tool_code_review,
     "extract_functions": _tool_extract,
     "find_todos": _tool_find_todos,
+    "lint": _tool_lint,
 }
 
 engine = SimpleEngine(TOOLS)
 
+@router.on_event("shutdown")
+def _shutdown_engine():
+    engine.shutdown()
+
 # helper DB session dependency
 def get_db():
     db = SessionLocal()
@@ -59,56 +78,92 @@ def create_graph(payload: GraphCreate, db: Session = Depends(get_db)):
     db.refresh(g)
     return GraphOut(graph_id=g.id, graph=payload.graph, created_at=g.created_at)
 
-def _run_and_persist(run_id: int):
-    # runs in background thread: load run and graph, execute, persist updates
+def _start_run(run_id: int):
+    # load run and graph and mark the run as running; returns (graph_def, initial_state) or None
     db = SessionLocal()
     try:
         run = db.get(Run, run_id)
         if not run:
-            return
-        # load graph
+            return None
         graph = db.get(Graph, run.graph_id)
         if not graph:
             run.status = "failed"
             run.updated_at = datetime.utcnow()
             db.commit()
-            return
-
-        graph_def = json.loads(graph.definition)
-        initial_state = json.loads(run.state or "{}")
-
-        def logger(msg):
-            # append to run.log (list)
-            logs = json.loads(run.log or "[]")
-            logs.append({"ts": datetime.utcnow().isoformat(), "msg": msg})
-            run.log = json.dumps(logs)
-            run.updated_at = datetime.utcnow()
-            db.commit()
+            return None
 
         run.status = "running"
         run.updated_at = datetime.utcnow()
         db.commit()
+        # blob references are fetched by arun_graph on a thread, not here on the request path
+        return json.loads(graph.definition), BlobState(json.loads(run.state or "{}"))
+    finally:
+        db.close()
 
-        # Execute
-        result = engine.run_graph(graph_def, initial_state, run_logger=logger)
+def _append_run_log(run_id: int, msg: str):
+    # append to run.log (list)
+    db = SessionLocal()
+    try:
+        run = db.get(Run, run_id)
+        logs = json.loads(run.log or "[]")
+        logs.append({"ts": datetime.utcnow().isoformat(), "msg": msg})
+        run.log = json.dumps(logs)
+        run.updated_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
 
-        # persist final
-        run.state = json.dumps(result.get("state", {}))
-        run.log = json.dumps(result.get("logs", []))
-        run.iterations = result.get("iterations", 0)
-        run.status = "done"
+def _finish_run(run_id: int, result: dict | None = None, error: Exception | None = None):
+    db = SessionLocal()
+    try:
+        run = db.get(Run, run_id)
+        if error is not None:
+            run.status = "failed"
+            run.log = json.dumps([{"error": str(error)}])
+        else:
+            state = dehydrate(result.get("state", {}))
+            # node results repeat what is in state; store them as the same blobs
+            logs = [
+                {**entry, "result": dehydrate(entry["result"])} if isinstance(entry.get("result"), dict) else entry
+                for entry in result.get("logs", [])
+            ]
+            run.state = json.dumps(state)
+            run.log = json.dumps(logs)
+            set_run_blobs(db, run_id, run_blob_keys(state, logs))
+            run.iterations = result.get("iterations", 0)
+            run.status = "done"
         run.updated_at = datetime.utcnow()
         db.commit()
+    finally:
+        db.close()
+
+async def _run_and_persist(run_id: int):
+    # runs on the event loop: tools go through engine.arun_graph (sync tools on the
+    # engine's own executor), DB writes use the loop's default executor
+    try:
+        loaded = await asyncio.to_thread(_start_run, run_id)
     except Exception as e:
+        logger.exception("Failed to start run %s", run_id)
         try:
-            run.status = "failed"
-            run.log = json.dumps([{"error": str(e)}])
-            run.updated_at = datetime.utcnow()
-            db.commit()
+            await asyncio.to_thread(_finish_run, run_id, None, e)
+        except Exception:
+            pass
+        return
+    if loaded is None:
+        return
+    graph_def, initial_state = loaded
+
+    async def run_logger(msg):
+        await asyncio.to_thread(_append_run_log, run_id, msg)
+
+    try:
+        result = await engine.arun_graph(graph_def, initial_state, run_logger=run_logger)
+        await asyncio.to_thread(_finish_run, run_id, result)
+    except Exception as e:
+        try:
+            await asyncio.to_thread(_finish_run, run_id, None, e)
         except Exception:
             pass
-    finally:
-        db.close()
 
 @router.post("/run")
 def run_graph(payload: GraphRunRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
@@ -117,31 +172,44 @@ def run_graph(payload: GraphRunRequest, background_tasks: BackgroundTasks, db: S
     if not graph:
         raise HTTPException(status_code=404, detail="Graph not found")
 
+    initial_state = dict(payload.initial_state or {})
+    if payload.source_hash:
+        if not touch_blob(payload.source_hash):
+            raise HTTPException(status_code=404, detail="Source not found")
+        initial_state["source"] = blob_ref(payload.source_hash)
+
+    # large values (sources) are stored once as blobs; the run only keeps references
+    state = dehydrate(initial_state)
     run = Run(
         graph_id=payload.graph_id,
-        state=json.dumps(payload.initial_state or {}),
+        state=json.dumps(state),
         status="created",
         log=json.dumps([]),
         created_at=datetime.utcnow(),
         updated_at=datetime.utcnow()
     )
     db.add(run)
+    db.flush()
+    set_run_blobs(db, run.id, run_blob_keys(state))
     db.commit()
     db.refresh(run)
 
-    # background execution using FastAPI BackgroundTasks
-    # but to ensure long running runs continue, start a thread
+    # background execution using FastAPI BackgroundTasks; _run_and_persist is a
+    # coroutine so it runs on the server's event loop instead of a thread per run
     background_tasks.add_task(_run_and_persist, run.id)
 
     return {"run_id": run.id, "status": run.status}
 
 @router.get("/state/{run_id}", response_model=RunStateOut)
-def get_run_state(run_id: int, db: Session = Depends(get_db)):
+def get_run_state(run_id: int, resolve: bool = False, db: Session = Depends(get_db)):
+    """Large state values come back as {"$blob": hash} references unless resolve=true."""
     run = db.get(Run, run_id)
     if not run:
         raise HTTPException(status_code=404, detail="Run not found")
 
     state = json.loads(run.state or "{}")
+    if resolve:
+        state = BlobState(state).resolved()
     log = json.loads(run.log or "[]")
     return RunStateOut(
         run_id=run.id,
@@ -153,3 +221,30 @@ def get_run_state(run_id: int, db: Session = Depends(get_db)):
         created_at=run.created_at,
         updated_at=run.updated_at
     )
+
+@router.get("/blob/{blob_hash}", response_model=BlobOut)
+def get_blob(blob_hash: str):
+    """Fetch a single value referenced from run state."""
+    try:
+        value = load_blob(blob_hash)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return BlobOut(hash=blob_hash, value=value)
+
+@router.get("/runs", response_model=PageOut)
+def list_runs(
+    after: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    order_by: Literal["id", "created_at"] = "id",
+    fields: str | None = Query(None, description="Comma-separated columns, e.g. id,graph_id,status"),
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(get_db),
+):
+    """List runs in pages; pass next_cursor back as `after`. state/log keep their blob references.
+    format=ndjson streams every run after the cursor (limit is ignored).
+    """
+    columns = parse_fields(fields, Run)
+    decoders = {"state": json_text, "log": json_text}
+    if format == "ndjson":
+        return export_ndjson(Run, columns, order_by, after, decoders)
+    return PageOut(**list_page(db, Run, columns, order_by, after, limit, decoders))
@@ -0,0 +1,108 @@
+# app/listing.py
+"""
+Keyset-paginated listing and NDJSON export shared by GET /reviews and GET /graph/runs.
+
+Pages are ordered by id or by (created_at, id) and continue from an opaque
+cursor, so every page costs the same no matter how deep the client is.
+Exports stream rows straight from the DB cursor (yield_per) without loading
+the result set into memory.
+"""
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import String, and_, or_, select, type_coerce
+
+from app.db import SessionLocal
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def parse_fields(fields: str | None, model) -> List[str]:
+    """Comma-separated column names -> list; all columns if not given."""
+    allowed = [c.name for c in model.__table__.columns]
+    if not fields:
+        return allowed
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}")
+    return requested
+
+
+def _cursor_created_at(model):
+    # compare created_at as stored (string on SQLite) so cursors round-trip exactly
+    return type_coerce(model.created_at, String)
+
+
+def build_query(model, fields: List[str], order_by: str, after: str | None):
+    columns = [getattr(model, f).label(f) for f in fields] + [model.id.label("_cursor_id")]
+    if order_by == "created_at":
+        created = _cursor_created_at(model)
+        columns.append(created.label("_cursor_created_at"))
+        stmt = select(*columns).order_by(model.created_at, model.id)
+        if after:
+            created_after, _, id_after = after.rpartition("|")
+            if not created_after or not id_after.isdigit():
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            stmt = stmt.where(or_(created > created_after, and_(created == created_after, model.id > int(id_after))))
+        return stmt
+
+    stmt = select(*columns).order_by(model.id)
+    if after:
+        if not after.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        stmt = stmt.where(model.id > int(after))
+    return stmt
+
+
+def _cursor(row, order_by: str) -> str:
+    if order_by == "created_at":
+        return f"{row._cursor_created_at}|{row._cursor_id}"
+    return str(row._cursor_id)
+
+
+def _encode(row, fields: List[str], decoders: Dict[str, Callable[[Any], Any]]) -> Dict[str, Any]:
+    item = {}
+    for f in fields:
+        value = getattr(row, f)
+        if f in decoders:
+            value = decoders[f](value)
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        item[f] = value
+    return item
+
+
+def list_page(db, model, fields, order_by, after, limit, decoders=None) -> Dict[str, Any]:
+    """One page of items plus the cursor for the next page (None on the last page)."""
+    rows = db.execute(build_query(model, fields, order_by, after).limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "items": [_encode(r, fields, decoders or {}) for r in rows],
+        "next_cursor": _cursor(rows[-1], order_by) if has_more else None,
+    }
+
+
+def _iter_ndjson(stmt, fields, decoders) -> Iterator[str]:
+    # own session: the request's Depends(get_db) session is closed before the body is streamed
+    db = SessionLocal()
+    try:
+        for row in db.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE)):
+            yield json.dumps(_encode(row, fields, decoders), default=str) + "\n"
+    finally:
+        db.close()
+
+
+def export_ndjson(model, fields, order_by, after, decoders=None) -> StreamingResponse:
+    """Stream every row after the cursor as NDJSON, one object per line."""
+    stmt = build_query(model, fields, order_by, after)
+    return StreamingResponse(_iter_ndjson(stmt, fields, decoders or {}), media_type="application/x-ndjson")
+
+
+def json_text(value):
+    # Run.state / Run.log are stored as JSON text
+    return json.loads(value) if value else None
@@ -5,14 +5,19 @@ import threading
 import webbrowser
 import logging
 from datetime import datetime
-from typing import Generator
+from typing import Generator, Literal
 
-from fastapi import FastAPI, HTTPException, UploadFile, File, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Depends, BackgroundTasks, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 # project modules (existing in your repo)
-from app.schemas import ReviewCreate, ReviewOut
-from app.agent import CodeReviewAgent
+from app.schemas import ReviewCreate, ReviewOut, PageOut
+from app.worker import review_pool, fast_pool, lint_pool
+from app.agent import FAST_STAGES, STAGES
+from app.blobs import put_blob
+from app import retention
+from app.listing import parse_fields, list_page, export_ndjson
 from app.db import SessionLocal, init_db
 from app.models import Review as ReviewModel
 
@@ -37,9 +42,6 @@ except Exception as e:
     logger.info("Graphs router not included: %s", e)
 
 
-agent = CodeReviewAgent()
-
-
 # --- Auto-open browser on startup (opens the docs) ---
 def _open_docs():
     try:
@@ -57,6 +59,16 @@ def _startup_event():
     if os.getenv("OPEN_BROWSER", "1") == "1":
         # slight delay to let server finish booting
         threading.Timer(1.0, _open_docs).start()
+    # periodic cleanup, only if a RETENTION_* rule is configured
+    retention.start_scheduler()
+
+
+@app.on_event("shutdown")
+def _shutdown_event():
+    retention.stop_scheduler()
+    review_pool.shutdown()
+    fast_pool.shutdown()
+    lint_pool.shutdown()
 
 
 # --- Dependency for DB session ---
@@ -80,22 +92,86 @@ def _iso(dt):
         return str(dt)
 
 
+def _review_out(r: ReviewModel) -> ReviewOut:
+    return ReviewOut(
+        id=r.id,
+        source_hash=r.source_hash,
+        summary=r.summary,
+        findings=r.findings,
+        suggestions=r.suggestions,
+        partial=bool(r.partial),
+        partial_reason=r.partial_reason,
+        pending_stages=r.pending_stages or [],
+        status="pending" if r.pending_stages else "complete",
+        created_at=_iso(r.created_at),
+    )
+
+
+def _review_for_mode(source: str, mode: str):
+    # fast requests use their own pool so they never wait behind full reviews / graph runs
+    if mode == "fast":
+        return fast_pool.review(source, FAST_STAGES)
+    return review_pool.review(source)
+
+
+def _complete_review(review_id: int, source: str, stages=("lint",)):
+    """Background second phase of mode=fast: run only the pending stages on lint_pool and merge them into the row."""
+    try:
+        results, reasons = lint_pool.run_stages(source, stages)
+    except Exception as exc:
+        logger.exception("Deferred review stages failed for review %s", review_id)
+        results, reasons = {}, [f"deferred stages failed: {exc}"]
+
+    db = SessionLocal()
+    try:
+        r = db.get(ReviewModel, review_id)
+        if not r:
+            return
+        stored = {
+            "findings": r.findings or [],
+            "suggestions": r.suggestions or [],
+            "partial_reason": r.partial_reason,
+            "pending_stages": r.pending_stages or [],
+        }
+        merged = lint_pool.agent.merge_stages(stored, results, "; ".join(reasons) or None, stages)
+        r.summary = merged["summary"]
+        r.findings = merged["findings"]
+        r.suggestions = merged["suggestions"]
+        r.partial = merged["partial"]
+        r.partial_reason = merged["partial_reason"]
+        r.pending_stages = merged["pending_stages"]
+        db.commit()
+    finally:
+        db.close()
+
+
 # --- POST /review (JSON body) ---
 @app.post("/review", response_model=ReviewOut)
-def submit_review(payload: ReviewCreate, db: Session = Depends(get_db)):
-    """Submit raw Python source for review and return the persisted review result."""
+def submit_review(
+    payload: ReviewCreate,
+    background_tasks: BackgroundTasks,
+    mode: Literal["full", "fast"] = "full",
+    db: Session = Depends(get_db),
+):
+    """Submit raw Python source for review and return the persisted review result.
+    mode=fast returns the AST/radon review immediately and finishes linting in the background;
+    poll GET /review/{id} until status is "complete".
+    """
     source = payload.source
     if not source or not source.strip():
         raise HTTPException(status_code=400, detail="Empty source provided")
 
     try:
-        review_data = agent.review_code(source)
+        review_data = _review_for_mode(source, mode)
     except Exception as exc:
         logger.exception("Code review failed for POST /review")
         raise HTTPException(status_code=500, detail=f"Code review failed: {str(exc)}")
 
     # persist
     try:
+        # keep the source so graph runs can start from this review's source_hash; stored
+        # first so a failure here never leaves a committed review behind a 500
+        put_blob(source)
         db_review = ReviewModel.from_dict(review_data)
         db.add(db_review)
         db.commit()
@@ -104,21 +180,22 @@ def submit_review(payload: ReviewCreate, db: Session = Depends(get_db)):
         logger.exception("Failed to persist review to DB")
         raise HTTPException(status_code=500, detail=f"Persistence error: {str(exc)}")
 
+    if db_review.pending_stages:
+        background_tasks.add_task(_complete_review, db_review.id, source, tuple(db_review.pending_stages))
+
     # return as schema, ensure created_at is a string
-    return ReviewOut(
-        id=db_review.id,
-        source_hash=db_review.source_hash,
-        summary=db_review.summary,
-        findings=db_review.findings,
-        suggestions=db_review.suggestions,
-        created_at=_iso(db_review.created_at),
-    )
+    return _review_out(db_review)
 
 
 # --- POST /review/file (upload a .py file) ---
 @app.post("/review/file", response_model=ReviewOut)
-async def submit_review_file(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """Upload a .py file for code review. Use key 'file' in multipart form."""
+async def submit_review_file(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    mode: Literal["full", "fast"] = "full",
+    db: Session = Depends(get_db),
+):
+    """Upload a .py file for code review. Use key 'file' in multipart form. mode works as for POST /review."""
     if not file.filename.endswith(".py"):
         raise HTTPException(status_code=400, detail="Only .py files are accepted")
     content_bytes = await file.read()
@@ -126,13 +203,17 @@ async def submit_review_file(file: UploadFile = File(...), db: Session = Depends
     source = content_bytes.decode("utf-8", errors="replace")
 
     try:
-        review_data = agent.review_code(source)
+        # blocking (queue wait + worker budget): keep it off the event loop that graph runs share
+        review_data = await run_in_threadpool(_review_for_mode, source, mode)
     except Exception as exc:
         logger.exception("Code review failed for uploaded file")
         raise HTTPException(status_code=500, detail=f"Code review failed: {str(exc)}")
 
     # persist
     try:
+        # keep the source so graph runs can start from this review's source_hash; stored
+        # first so a failure here never leaves a committed review behind a 500
+        put_blob(source)
         db_review = ReviewModel.from_dict(review_data)
         db.add(db_review)
         db.commit()
@@ -141,14 +222,10 @@ async def submit_review_file(file: UploadFile = File(...), db: Session = Depends
         logger.exception("Failed to persist uploaded-file review to DB")
         raise HTTPException(status_code=500, detail=f"Persistence error: {str(exc)}")
 
-    return ReviewOut(
-        id=db_review.id,
-        source_hash=db_review.source_hash,
-        summary=db_review.summary,
-        findings=db_review.findings,
-        suggestions=db_review.suggestions,
-        created_at=_iso(db_review.created_at),
-    )
+    if db_review.pending_stages:
+        background_tasks.add_task(_complete_review, db_review.id, source, tuple(db_review.pending_stages))
+
+    return _review_out(db_review)
 
 
 # --- GET /review/{review_id} ---
@@ -159,12 +236,23 @@ def get_review(review_id: int, db: Session = Depends(get_db)):
     if not r:
         raise HTTPException(status_code=404, detail="Review not found")
 
-    return ReviewOut(
-        id=r.id,
-        source_hash=r.source_hash,
-        summary=r.summary,
-        findings=r.findings,
-        suggestions=r.suggestions,
-        created_at=_iso(r.created_at),
-    )
+    return _review_out(r)
 
+
+# --- GET /reviews (keyset pagination / NDJSON export) ---
+@app.get("/reviews", response_model=PageOut)
+def list_reviews(
+    after: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    order_by: Literal["id", "created_at"] = "id",
+    fields: str | None = Query(None, description="Comma-separated columns, e.g. id,source_hash,summary"),
+    format: Literal["json", "ndjson"] = "json",
+    db: Session = Depends(get_db),
+):
+    """List reviews in pages; pass next_cursor back as `after`.
+    format=ndjson streams every review after the cursor (limit is ignored).
+    """
+    columns = parse_fields(fields, ReviewModel)
+    if format == "ndjson":
+        return export_ndjson(ReviewModel, columns, order_by, after)
+    return PageOut(**list_page(db, ReviewModel, columns, order_by, after, limit))
@@ -1,5 +1,5 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, JSON, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, JSON, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.sql import func
 from app.db import Base
 from typing import Dict, Any
@@ -7,13 +7,18 @@ import json
 
 class Review(Base):
     __tablename__ = "reviews"
+    # "keep latest N per source_hash" retention rule
+    __table_args__ = (Index("ix_reviews_source_hash_created_at", "source_hash", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     source_hash = Column(String(64), nullable=False)
     summary = Column(String(1024), nullable=False)
     findings = Column(JSON, nullable=False)
     suggestions = Column(JSON, nullable=False)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    partial = Column(Boolean, nullable=False, default=False, server_default="0")  # review cut short by a budget
+    partial_reason = Column(String(1024), nullable=True)
+    pending_stages = Column(JSON, nullable=True)  # stages still running in the background (mode=fast)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
     @classmethod
     def from_dict(cls, d: Dict[str, Any]):
@@ -22,6 +27,9 @@ class Review(Base):
             summary=d.get("summary", ""),
             findings=d.get("findings", []),
             suggestions=d.get("suggestions", []),
+            partial=d.get("partial", False),
+            partial_reason=d.get("partial_reason"),
+            pending_stages=d.get("pending_stages", []),
         )
 
     def to_schema(self):
@@ -31,9 +39,28 @@ class Review(Base):
             "summary": self.summary,
             "findings": self.findings,
             "suggestions": self.suggestions,
+            "partial": bool(self.partial),
+            "partial_reason": self.partial_reason,
+            "pending_stages": self.pending_stages or [],
             "created_at": self.created_at.isoformat() if self.created_at else None,
         }
 
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    hash = Column(String(64), primary_key=True)  # sha256, see app.blobs
+    data = Column(Text, nullable=False)          # JSON text of the value
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    last_used_at = Column(DateTime(timezone=True), nullable=True, index=True)  # set when stored again / reused
+
+class RunBlob(Base):
+    """Blob references held by a run's state/log, written in the same transaction as the run."""
+    __tablename__ = "run_blobs"
+
+    run_id = Column(Integer, ForeignKey("runs.id"), primary_key=True)
+    hash = Column(String(64), primary_key=True, index=True)
+
 class Graph(Base):
     __tablename__ = "graphs"
 
@@ -50,5 +77,5 @@ class Run(Base):
     log = Column(String, nullable=True)     # JSON text (list)
     status = Column(String, nullable=False, default="created")  # created | running | done | failed
     iterations = Column(Integer, nullable=True, default=0)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,287 @@
+# app/retention.py
+"""
+Retention for the reviews, runs and blobs tables.
+
+Rules (all optional, configured via env or CLI flags):
+  - per-table TTLs: delete reviews/finished runs older than N days, and blobs
+    not used for N days that no review or run references (run_blobs)
+  - keep latest N reviews per source_hash: older duplicates are deleted
+Rows are deleted in bounded batches (one short transaction each) and, if an
+archive directory is set, the rows each DELETE returned are written to
+gzip-compressed NDJSON files before the batch commits.
+On SQLite, freed pages are returned to the OS with PRAGMA incremental_vacuum.
+
+Run once:       python -m app.retention --reviews-days 90 --keep-latest 5 --archive-dir archive/
+Scheduled:      set RETENTION_* env vars; the API starts a background sweeper.
+"""
+import argparse
+import gzip
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, List
+
+from sqlalchemy import and_, delete, exists, func, or_, select, text
+
+from app.db import SessionLocal, engine, DB_URL
+from app.models import Review, Run, Blob, RunBlob
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str) -> int | None:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+class RetentionPolicy:
+    def __init__(
+        self,
+        reviews_days: int | None = None,
+        runs_days: int | None = None,
+        blobs_days: int | None = None,
+        keep_latest: int | None = None,
+        archive_dir: str | None = None,
+        batch_size: int = 500,
+        vacuum_pages: int = 1000,
+    ):
+        self.reviews_days = reviews_days
+        self.runs_days = runs_days
+        self.blobs_days = blobs_days
+        self.keep_latest = keep_latest
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(
+            reviews_days=_env_int("RETENTION_REVIEWS_DAYS"),
+            runs_days=_env_int("RETENTION_RUNS_DAYS"),
+            blobs_days=_env_int("RETENTION_BLOBS_DAYS"),
+            keep_latest=_env_int("RETENTION_KEEP_LATEST"),
+            archive_dir=os.getenv("RETENTION_ARCHIVE_DIR") or None,
+            batch_size=_env_int("RETENTION_BATCH_SIZE") or 500,
+            vacuum_pages=_env_int("RETENTION_VACUUM_PAGES") or 1000,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return any(v is not None for v in (self.reviews_days, self.runs_days, self.blobs_days, self.keep_latest))
+
+
+def _cutoff(days: int) -> datetime:
+    return datetime.utcnow() - timedelta(days=days)
+
+
+class _Archive:
+    """Appends rows to <dir>/<table>-<timestamp>.ndjson.gz, one file per table per sweep."""
+
+    def __init__(self, directory: str | None):
+        self.directory = directory
+        self.stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+
+    def write(self, table: str, rows: List[Dict[str, Any]]):
+        if not self.directory or not rows:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{table}-{self.stamp}.ndjson.gz")
+        with gzip.open(path, "at", encoding="utf-8") as fh:
+            for row in rows:
+                fh.write(json.dumps(row, default=str) + "\n")
+
+
+def _delete_batch(db, model, id_column, ids, id_query, archive: _Archive, dependents, recheck) -> int:
+    for column in dependents:
+        db.execute(delete(column.table).where(column.in_(ids)))
+    stmt = delete(model).where(id_column.in_(ids))
+    if recheck:
+        stmt = stmt.where(id_column.in_(id_query.order_by(None).correlate(None)))
+    # archive/count exactly what was deleted (recheck may keep some of the selected ids)
+    deleted = db.execute(stmt.returning(*model.__table__.columns)).all()
+    archive.write(model.__tablename__, [dict(row._mapping) for row in deleted])
+    db.commit()
+    return len(deleted)
+
+
+def _purge(
+    model, id_column, id_query, archive: _Archive, batch_size: int, dry_run: bool, dependents=(), recheck=False
+) -> int:
+    """Delete rows selected by id_query in batches of batch_size; returns the number of rows deleted.
+       id_query: a select of ids, re-run for every batch, or a list of ids computed once up front.
+       dependents: (column, ...) of child rows deleted in the same transaction (not archived).
+       recheck: re-apply id_query inside the DELETE so rows that became live meanwhile are kept.
+    """
+    if isinstance(id_query, list):
+        if dry_run:
+            return len(id_query)
+        total = 0
+        for start in range(0, len(id_query), batch_size):
+            db = SessionLocal()
+            try:
+                total += _delete_batch(
+                    db, model, id_column, id_query[start:start + batch_size], None, archive, dependents, False
+                )
+            finally:
+                db.close()
+        return total
+
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids = list(db.scalars(id_query.limit(batch_size)))
+            if not ids:
+                return total
+            if dry_run:
+                # nothing is deleted, so further batches would return the same ids
+                return total + len(db.scalars(id_query).all())
+            total += _delete_batch(db, model, id_column, ids, id_query, archive, dependents, recheck)
+        finally:
+            db.close()
+        if len(ids) < batch_size:
+            return total
+
+
+def sweep(policy: RetentionPolicy, dry_run: bool = False) -> Dict[str, int]:
+    """Apply the policy once. Returns the number of rows removed (or that would be) per rule."""
+    archive = _Archive(policy.archive_dir)
+    stats: Dict[str, int] = {}
+
+    if policy.reviews_days is not None:
+        q = select(Review.id).where(Review.created_at < _cutoff(policy.reviews_days)).order_by(Review.id)
+        stats["reviews_expired"] = _purge(Review, Review.id, q, archive, policy.batch_size, dry_run)
+
+    if policy.keep_latest is not None:
+        ranked = select(
+            Review.id,
+            func.row_number().over(
+                partition_by=Review.source_hash, order_by=(Review.created_at.desc(), Review.id.desc())
+            ).label("rn"),
+        ).subquery()
+        q = select(ranked.c.id).where(ranked.c.rn > policy.keep_latest).order_by(ranked.c.id)
+        # one window pass per sweep, not per batch; newer reviews can't make these ids current again
+        db = SessionLocal()
+        try:
+            ids = list(db.scalars(q))
+        finally:
+            db.close()
+        stats["reviews_superseded"] = _purge(Review, Review.id, ids, archive, policy.batch_size, dry_run)
+
+    if policy.runs_days is not None:
+        # never touch runs that are still queued or executing
+        q = (
+            select(Run.id)
+            .where(Run.created_at < _cutoff(policy.runs_days), Run.status.in_(("done", "failed")))
+            .order_by(Run.id)
+        )
+        stats["runs_expired"] = _purge(
+            Run, Run.id, q, archive, policy.batch_size, dry_run, dependents=(RunBlob.run_id,)
+        )
+
+    if policy.blobs_days is not None:
+        # a blob is still live if it was used recently, is a review's source or is listed in run_blobs;
+        # all three are index lookups
+        cutoff = _cutoff(policy.blobs_days)
+        q = (
+            select(Blob.hash)
+            .where(
+                or_(Blob.last_used_at < cutoff, and_(Blob.last_used_at.is_(None), Blob.created_at < cutoff)),
+                ~exists().where(Review.source_hash == Blob.hash),
+                ~exists().where(RunBlob.hash == Blob.hash),
+            )
+            .order_by(Blob.hash)
+        )
+        stats["blobs_unreferenced"] = _purge(Blob, Blob.hash, q, archive, policy.batch_size, dry_run, recheck=True)
+
+    if not dry_run:
+        incremental_vacuum(policy.vacuum_pages)
+    return stats
+
+
+def incremental_vacuum(pages: int):
+    """Release up to `pages` free pages on SQLite databases in incremental auto_vacuum mode."""
+    if not DB_URL.startswith("sqlite"):
+        return
+    with engine.connect() as conn:
+        if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:  # 2 = INCREMENTAL
+            logger.info("SQLite auto_vacuum is not INCREMENTAL; run `python -m app.retention --enable-incremental-vacuum` once")
+            return
+        conn.execute(text(f"PRAGMA incremental_vacuum({int(pages)})"))
+        conn.commit()
+
+
+def enable_incremental_vacuum():
+    """One-off conversion of an existing SQLite DB to auto_vacuum=INCREMENTAL (rewrites the file)."""
+    if not DB_URL.startswith("sqlite"):
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+
+
+# --- scheduled sweeps inside the API process ---
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+
+_stop = threading.Event()
+
+
+def start_scheduler(policy: RetentionPolicy | None = None, interval: float = RETENTION_INTERVAL):
+    """Start a daemon thread that sweeps every `interval` seconds. No-op if no rule is configured."""
+    policy = policy or RetentionPolicy.from_env()
+    if not policy.enabled or interval <= 0:
+        return None
+
+    def loop():
+        while not _stop.wait(interval):
+            try:
+                logger.info("Retention sweep: %s", sweep(policy))
+            except Exception:
+                logger.exception("Retention sweep failed")
+
+    _stop.clear()
+    t = threading.Thread(target=loop, name="retention", daemon=True)
+    t.start()
+    return t
+
+
+def stop_scheduler():
+    _stop.set()
+
+
+def main(argv=None):
+    env = RetentionPolicy.from_env()
+    parser = argparse.ArgumentParser(description="Delete/archive old reviews, runs and blobs.")
+    parser.add_argument("--reviews-days", type=int, default=env.reviews_days)
+    parser.add_argument("--runs-days", type=int, default=env.runs_days)
+    parser.add_argument("--blobs-days", type=int, default=env.blobs_days)
+    parser.add_argument("--keep-latest", type=int, default=env.keep_latest, help="reviews to keep per source_hash")
+    parser.add_argument("--archive-dir", default=env.archive_dir, help="write deleted rows here as .ndjson.gz")
+    parser.add_argument("--batch-size", type=int, default=env.batch_size)
+    parser.add_argument("--vacuum-pages", type=int, default=env.vacuum_pages)
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would be removed")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="convert an existing SQLite DB to incremental auto_vacuum (one-off full VACUUM)")
+    args = parser.parse_args(argv)
+
+    from app.db import init_db
+    init_db()
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+
+    policy = RetentionPolicy(
+        reviews_days=args.reviews_days,
+        runs_days=args.runs_days,
+        blobs_days=args.blobs_days,
+        keep_latest=args.keep_latest,
+        archive_dir=args.archive_dir,
+        batch_size=args.batch_size,
+        vacuum_pages=args.vacuum_pages,
+    )
+    print(json.dumps(sweep(policy, dry_run=args.dry_run)))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,10 @@ class ReviewOut(BaseModel):
     summary: str
     findings: List[Dict[str, Any]]
     suggestions: List[str]
+    partial: bool = False
+    partial_reason: str | None = None
+    pending_stages: List[str] = []
+    status: str = "complete"  # "pending" while deferred stages (lint) are still running
     created_at: str | None = None
 
     model_config = ConfigDict(from_attributes=True)
@@ -31,6 +35,8 @@ class GraphOut(BaseModel):
 class GraphRunRequest(BaseModel):
     graph_id: int
     initial_state: Dict[str, Any] | None = None
+    # start from a stored source (e.g. a review's source_hash) instead of sending it again
+    source_hash: str | None = None
 
 class RunStateOut(BaseModel):
     run_id: int
@@ -43,3 +49,12 @@ class RunStateOut(BaseModel):
     updated_at: datetime | None = None
 
     model_config = ConfigDict(from_attributes=True)
+
+class BlobOut(BaseModel):
+    hash: str
+    value: Any
+
+# Listing (keyset pagination)
+class PageOut(BaseModel):
+    items: List[Dict[str, Any]]
+    next_cursor: str | None = None
@@ -1,15 +1,31 @@
 import ast
-from typing import List, Tuple, Dict
-from radon.complexity import cc_visit, cc_rank
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Tuple, Dict
+from radon.complexity import cc_visit_ast, cc_rank
+
+# Bounded LRU cache of per-function analysis, keyed by function fingerprint.
+# Shared by every review in the process so unchanged functions in an edited file
+# skip radon entirely; only their line numbers come from the fresh parse.
+FUNCTION_CACHE_SIZE = int(os.getenv("FUNCTION_CACHE_SIZE", "4096"))
+_function_cache: "OrderedDict[str, Tuple[int, str | None]]" = OrderedDict()
+_function_cache_lock = threading.Lock()
+
+# Optional hook used inside review worker processes: given fingerprints missing
+# from the local cache, return known entries from the API process's cache (see app.worker).
+_cache_prefetch: Callable[[List[str]], Dict[str, Tuple[int, str | None]]] | None = None
 
 class FunctionInfo:
-    def __init__(self, name: str, lineno: int, end_lineno: int | None, complexity: int, length: int, rank: str | None = None):
+    def __init__(self, name: str, lineno: int, end_lineno: int | None, complexity: int, length: int, rank: str | None = None, fingerprint: str | None = None):
         self.name = name
         self.lineno = lineno
         self.end_lineno = end_lineno
         self.complexity = complexity
         self.length = length
         self.rank = rank
+        self.fingerprint = fingerprint
 
     def to_dict(self):
         return {
@@ -22,35 +38,93 @@ class FunctionInfo:
         }
 
 
+def function_fingerprint(node: ast.AST) -> str:
+    """Hash a function's normalized AST (no line/column offsets, no comments)."""
+    return hashlib.sha256(ast.dump(node).encode("utf-8")).hexdigest()
+
+
+def _function_complexity(node: ast.AST) -> Tuple[int, str | None]:
+    """Run radon on a single function node and return (complexity, rank)."""
+    try:
+        blocks = cc_visit_ast(ast.Module(body=[node], type_ignores=[]))
+    except Exception:
+        # radon failed (unlikely if installed), fallback: keep basic complexity
+        return 1, None
+    if not blocks:
+        return 1, None
+    return blocks[0].complexity, cc_rank(blocks[0].complexity)
+
+
+def _cached_complexity(fingerprint: str, node: ast.AST) -> Tuple[int, str | None]:
+    with _function_cache_lock:
+        hit = _function_cache.get(fingerprint)
+        if hit is not None:
+            _function_cache.move_to_end(fingerprint)
+            return hit
+
+    result = _function_complexity(node)
+
+    with _function_cache_lock:
+        _function_cache[fingerprint] = result
+        while len(_function_cache) > FUNCTION_CACHE_SIZE:
+            _function_cache.popitem(last=False)
+    return result
+
+
+def clear_function_cache() -> None:
+    with _function_cache_lock:
+        _function_cache.clear()
+
+
+def function_cache_get_many(fingerprints: Iterable[str]) -> Dict[str, Tuple[int, str | None]]:
+    with _function_cache_lock:
+        hits = {fp: _function_cache[fp] for fp in fingerprints if fp in _function_cache}
+        for fp in hits:
+            _function_cache.move_to_end(fp)
+    return hits
+
+
+def function_cache_put_many(entries: Dict[str, Tuple[int, str | None]]) -> None:
+    with _function_cache_lock:
+        for fp, value in entries.items():
+            _function_cache[fp] = tuple(value)
+            _function_cache.move_to_end(fp)
+        while len(_function_cache) > FUNCTION_CACHE_SIZE:
+            _function_cache.popitem(last=False)
+
+
+def set_function_cache_prefetch(fn: Callable[[List[str]], Dict[str, Tuple[int, str | None]]] | None) -> None:
+    global _cache_prefetch
+    _cache_prefetch = fn
+
+
 def extract_functions(source: str) -> List[FunctionInfo]:
-    """Parse Python source and return function metadata (including radon complexity)."""
+    """Parse Python source and return function metadata (including radon complexity).
+
+    Complexity and rank are cached per function fingerprint, so re-reviewing an
+    edited file only runs radon on the functions whose code actually changed.
+    """
     tree = ast.parse(source)
     functions: List[FunctionInfo] = []
 
+    nodes = [n for n in ast.walk(tree) if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    fingerprints = [function_fingerprint(n) for n in nodes]
+    if _cache_prefetch is not None:
+        with _function_cache_lock:
+            missing = [fp for fp in fingerprints if fp not in _function_cache]
+        if missing:
+            function_cache_put_many(_cache_prefetch(missing))
+
     # use ast to get positions and length
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-            name = node.name
-            lineno = getattr(node, "lineno", 0)
-            end_lineno = getattr(node, "end_lineno", None)
-            length = (end_lineno - lineno + 1) if end_lineno else 0
-            # placeholder complexity; we'll override with radon below if possible
-            functions.append(FunctionInfo(name, lineno, end_lineno, complexity=1, length=length))
-
-    # Use radon to compute complexity info for the whole source
-    try:
-        blocks = cc_visit(source)
-        # blocks are Radon objects with .name and .complexity
-        for b in blocks:
-            # Radon names usually include the full path or module: try to match by name only
-            short_name = b.name.split('.')[-1]
-            for f in functions:
-                if f.name == short_name:
-                    f.complexity = b.complexity
-                    f.rank = cc_rank(b.complexity)
-    except Exception:
-        # radon failed (unlikely if installed), fallback: keep basic complexity
-        pass
+    for node, fingerprint in zip(nodes, fingerprints):
+        name = node.name
+        lineno = getattr(node, "lineno", 0)
+        end_lineno = getattr(node, "end_lineno", None)
+        length = (end_lineno - lineno + 1) if end_lineno else 0
+        complexity, rank = _cached_complexity(fingerprint, node)
+        functions.append(
+            FunctionInfo(name, lineno, end_lineno, complexity=complexity, length=length, rank=rank, fingerprint=fingerprint)
+        )
 
     return functions
 
@@ -76,5 +150,4 @@ def find_todos_and_prints(source: str) -> List[Tuple[int, str]]:
 
 
 def compute_source_hash(source: str) -> str:
-    import hashlib
     return hashlib.sha256(source.encode("utf-8")).hexdigest()
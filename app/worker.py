@@ -0,0 +1,207 @@
+# app/worker.py
+"""
+Run reviews in isolated worker processes under a wall-clock and memory budget.
+
+Each worker is a long-lived process that reviews one source at a time and
+streams back every stage as it finishes. If a review exceeds its budget (or the
+worker dies) the worker is killed and replaced, and the caller gets the stages
+that did finish, marked as partial. Workers are recycled after a fixed number
+of tasks so slow leaks in radon/ast can't accumulate. Time spent waiting for a
+free worker counts against the same budget.
+
+The function fingerprint cache (app.utils) lives in the API process, not in the
+workers: a worker asks the pool for entries it is missing before running radon,
+and every functions result is merged back. Workers stay disposable and any
+worker can serve a re-review cheaply, at the cost of one extra pipe round-trip
+per review.
+"""
+import multiprocessing
+import os
+import queue
+import time
+from typing import Dict, Any, List, Tuple
+
+from app.agent import CodeReviewAgent, STAGES
+from app.utils import function_cache_get_many, function_cache_put_many, set_function_cache_prefetch
+
+try:
+    import resource
+except ImportError:  # not available on Windows; memory budget is skipped there
+    resource = None
+
+REVIEW_WORKERS = int(os.getenv("REVIEW_WORKERS", "2"))
+REVIEW_TIMEOUT = float(os.getenv("REVIEW_TIMEOUT", "30"))
+REVIEW_MEMORY_MB = int(os.getenv("REVIEW_MEMORY_MB", "1024"))  # 0 disables the limit
+REVIEW_MAX_TASKS_PER_WORKER = int(os.getenv("REVIEW_MAX_TASKS_PER_WORKER", "100"))
+REVIEW_FAST_WORKERS = int(os.getenv("REVIEW_FAST_WORKERS", "1"))  # first phase of mode=fast reviews
+REVIEW_LINT_WORKERS = int(os.getenv("REVIEW_LINT_WORKERS", "1"))  # deferred lint of mode=fast reviews
+
+# spawn (not fork): the API process has DB/threadpool threads we must not fork.
+_ctx = multiprocessing.get_context("spawn")
+
+
+def _worker_main(conn, memory_mb: int):
+    """Worker process loop: receive (source, stages), send ("stage", ...) per stage, then ("done",)."""
+    if resource is not None and memory_mb > 0:
+        limit = memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass
+
+    def prefetch(fingerprints):
+        # ask the parent for cached complexity of these functions (answered in _Worker.run)
+        conn.send(("lookup", fingerprints))
+        return conn.recv()
+
+    set_function_cache_prefetch(prefetch)
+    agent = CodeReviewAgent()
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        source, stages = task
+        try:
+            for stage, result, reason in agent.iter_stages(source, stages):
+                conn.send(("stage", stage, result, reason))
+            conn.send(("done",))
+        except Exception as e:
+            # not a budget problem (e.g. SyntaxError): let the caller raise it
+            conn.send(("raise", e))
+
+
+class _Worker:
+    def __init__(self, memory_mb: int):
+        self.conn, child_conn = _ctx.Pipe()
+        self.process = _ctx.Process(target=_worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+
+    def run(self, source: str, stages, deadline: float, timeout: float) -> Tuple[Dict[str, Any], List[str], bool, Exception | None]:
+        """Returns (stage results, partial reasons, healthy, error).
+           healthy=False means the worker must be discarded; error is an exception raised by the review itself.
+        """
+        self.tasks += 1
+        results: Dict[str, Any] = {}
+        reasons: List[str] = []
+        self.conn.send((source, stages))
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self.conn.poll(remaining):
+                reasons.append(f"time budget of {timeout:g}s exceeded")
+                return results, reasons, False, None
+            try:
+                msg = self.conn.recv()
+            except (EOFError, OSError):
+                reasons.append(f"review worker died (exit code {self.process.exitcode}), memory budget likely exceeded")
+                return results, reasons, False, None
+            if msg[0] == "done":
+                return results, reasons, True, None
+            if msg[0] == "raise":
+                return results, reasons, True, msg[1]
+            if msg[0] == "lookup":
+                self.conn.send(function_cache_get_many(msg[1]))
+                continue
+            _, stage, result, reason = msg
+            if reason:
+                reasons.append(reason)
+            else:
+                results[stage] = result
+                if stage == "functions":
+                    function_cache_put_many({f.fingerprint: (f.complexity, f.rank) for f in result if f.fingerprint})
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout=1)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ReviewWorkerPool:
+    """Fixed-size pool of review workers. Workers are started lazily on first use."""
+
+    def __init__(
+        self,
+        workers: int = REVIEW_WORKERS,
+        timeout: float = REVIEW_TIMEOUT,
+        memory_mb: int = REVIEW_MEMORY_MB,
+        max_tasks_per_worker: int = REVIEW_MAX_TASKS_PER_WORKER,
+    ):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.agent = CodeReviewAgent()
+        # each slot holds an idle worker, or None if one has to be (re)started
+        self._slots: "queue.Queue[_Worker | None]" = queue.Queue()
+        for _ in range(self.workers):
+            self._slots.put(None)
+
+    def review(self, source: str, stages=STAGES) -> Dict[str, Any]:
+        """Review source in a worker; same result shape as CodeReviewAgent.review_code.
+           Passing a subset of stages leaves the rest as pending_stages.
+        """
+        results, reasons = self.run_stages(source, stages)
+        return self.agent.build_review(source, results, "; ".join(reasons) or None, stages)
+
+    def run_stages(self, source: str, stages=STAGES) -> Tuple[Dict[str, Any], List[str]]:
+        """Run stages in a worker; returns (results of the stages that finished, partial reasons)."""
+        deadline = time.monotonic() + self.timeout
+        try:
+            worker = self._slots.get(timeout=self.timeout)
+        except queue.Empty:
+            return {}, [f"queued past time budget of {self.timeout:g}s"]
+        try:
+            if worker is None or not worker.process.is_alive():
+                worker = _Worker(self.memory_mb)
+            results, reasons, healthy, error = worker.run(source, stages, deadline, self.timeout)
+        except BaseException:
+            # worker state is unknown (e.g. broken pipe); replace it
+            if worker is not None:
+                worker.kill()
+            self._slots.put(None)
+            raise
+
+        if not healthy:
+            worker.kill()
+            worker = None
+        elif worker.tasks >= self.max_tasks_per_worker:
+            worker.close()
+            worker = None
+        self._slots.put(worker)
+
+        if error is not None:
+            raise error
+        return results, reasons
+
+    def shutdown(self):
+        while True:
+            try:
+                worker = self._slots.get_nowait()
+            except queue.Empty:
+                return
+            if worker is not None:
+                worker.close()
+
+
+# Shared pool used by the API and the graph tools.
+review_pool = ReviewWorkerPool()
+
+# Interactive first phase of mode=fast reviews; separate so it never queues behind full
+# reviews or graph fan-outs on review_pool.
+fast_pool = ReviewWorkerPool(workers=REVIEW_FAST_WORKERS)
+
+# Background lint for mode=fast reviews; separate so it never holds a review_pool slot.
+lint_pool = ReviewWorkerPool(workers=REVIEW_LINT_WORKERS)
@@ -1,4 +1,5 @@
 # tests/test_graphs.py
+import os
 import time
 import json
 from fastapi.testclient import TestClient
@@ -49,3 +50,183 @@ def test_create_and_run_graph():
     # final assert: should be done
     final = client.get(f"/graph/state/{run_id}").json()
     assert final["status"] == "done"
+
+def test_arun_graph_mixes_sync_and_async_tools():
+    import asyncio
+    from app.engine import SimpleEngine
+
+    async def slow_double(state):
+        await asyncio.sleep(0.05)
+        return {"x": state["x"] * 2}
+
+    def inc(state):
+        return {"x": state["x"] + 1}
+
+    engine = SimpleEngine({"double": slow_double, "inc": inc})
+    graph = {
+        "nodes": {"d": {"fn": "double"}, "i": {"fn": "inc"}},
+        "edges": {"d": "i", "i": "end"},
+        "start": "d",
+    }
+
+    async def main():
+        return await asyncio.gather(*(engine.arun_graph(graph, {"x": n}) for n in range(100)))
+
+    results = asyncio.run(main())
+    assert [r["state"]["x"] for r in results] == [n * 2 + 1 for n in range(100)]
+    # the sync runner drives coroutine tools too
+    assert engine.run_graph(graph, {"x": 3})["state"]["x"] == 7
+
+def test_map_node_reviews_list_of_sources():
+    from app.engine import SimpleEngine
+    from app.graphs import TOOLS
+
+    engine = SimpleEngine(TOOLS, map_workers=2)
+    graph = {
+        "nodes": {"review_all": {"map": "code_review", "over": "sources", "into": "reviews", "chunk_size": 2}},
+        "start": "review_all",
+    }
+    sources = ["def a():\n    return 1\n", "def (", "def b():\n    pass\n"]
+    try:
+        result = engine.run_graph(graph, {"sources": sources})
+        # code_review feeds the shared review_pool from the map threads: no process pool,
+        # and the sync-tool executor is left alone
+        used = (engine._process_pool, engine._map_threads)
+    finally:
+        engine.shutdown()
+
+    reviews = result["state"]["reviews"]
+    assert len(reviews) == 3
+    assert reviews[0]["review"]["findings"][0]["name"] == "a"
+    assert "error" in reviews[1]
+    assert reviews[2]["review"]["findings"][0]["name"] == "b"
+    assert result["logs"][-1]["result"] == {"into": "reviews", "count": 3, "errors": 1}
+    assert used[0] is None and used[1] is not None
+
+def _crash_on_boom(state):
+    # map tool for the test below; runs in a spawned map worker
+    if state["source"] == "boom":
+        os._exit(1)
+    return {"n": len(state["source"])}
+
+def test_map_worker_crash_only_fails_the_crashing_element():
+    from app.engine import SimpleEngine
+
+    engine = SimpleEngine({"crash": _crash_on_boom}, map_workers=4)
+    graph = {"nodes": {"m": {"map": "crash", "over": "sources", "into": "out", "chunk_size": 1}}, "start": "m"}
+    sources = ["a", "bb", "ccc", "boom", "dddd", "eeeee", "ffffff", "ggggggg"]
+    try:
+        out = engine.run_graph(graph, {"sources": sources})["state"]["out"]
+    finally:
+        engine.shutdown()
+    assert "map worker crashed" in out[3]["error"]
+    assert [r for i, r in enumerate(out) if i != 3] == [{"n": len(s)} for s in sources if s != "boom"]
+
+def test_map_max_concurrency_follows_tool_cap():
+    import threading
+    from app.engine import SimpleEngine
+
+    lock = threading.Lock()
+    running = [0, 0]  # current, peak
+
+    def tool(state):
+        with lock:
+            running[0] += 1
+            running[1] = max(running[1], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return {}
+
+    tool.map_executor = "thread"
+    tool.map_max_concurrency = 2
+    engine = SimpleEngine({"t": tool}, map_workers=8)
+    graph = {"nodes": {"m": {"map": "t", "over": "xs", "chunk_size": 1, "max_concurrency": 8}}, "start": "m"}
+    try:
+        engine.run_graph(graph, {"xs": list(range(10))})
+    finally:
+        engine.shutdown()
+    assert running[1] <= 2
+
+def test_run_from_review_source_hash_keeps_blob_refs():
+    source = "def add(a, b):\n    return a + b\n" + "# TODO: padding so the review is stored as a blob\n" * 30
+    review = client.post("/review", json={"source": source}).json()
+
+    graph = {"nodes": {"review": {"fn": "code_review"}}, "start": "review"}
+    graph_id = client.post("/graph/create", json={"graph": graph}).json()["graph_id"]
+    run_res = client.post("/graph/run", json={"graph_id": graph_id, "source_hash": review["source_hash"]})
+    assert run_res.status_code == 200
+    run_id = run_res.json()["run_id"]
+
+    st = client.get(f"/graph/state/{run_id}").json()
+    assert st["status"] == "done"
+    assert st["state"]["source"] == {"$blob": review["source_hash"]}
+    assert "$blob" in st["state"]["review"]
+    # references are recorded next to the run for retention
+    from app.db import SessionLocal
+    from app.models import RunBlob
+    db = SessionLocal()
+    try:
+        refs = {rb.hash for rb in db.query(RunBlob).filter(RunBlob.run_id == run_id)}
+    finally:
+        db.close()
+    assert refs == {review["source_hash"], st["state"]["review"]["$blob"]}
+
+    resolved = client.get(f"/graph/state/{run_id}", params={"resolve": True}).json()["state"]
+    assert resolved["source"] == source
+    assert resolved["review"]["findings"][0]["name"] == "add"
+
+    blob = client.get(f"/graph/blob/{review['source_hash']}").json()
+    assert blob["value"] == source
+    assert client.post("/graph/run", json={"graph_id": graph_id, "source_hash": "0" * 64}).status_code == 404
+
+def test_run_marked_failed_when_start_raises(monkeypatch):
+    import asyncio
+    from app import graphs
+
+    graph_id = client.post("/graph/create", json={"graph": {"nodes": {}, "start": None}}).json()["graph_id"]
+
+    def broken_start(run_id):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(graphs, "_start_run", broken_start)
+    run_id = client.post("/graph/run", json={"graph_id": graph_id}).json()["run_id"]
+    asyncio.run(graphs._run_and_persist(run_id))
+    st = client.get(f"/graph/state/{run_id}").json()
+    assert st["status"] == "failed"
+    assert st["log"] == [{"error": "db down"}]
+
+def test_blob_keys_for_strings_and_json_values_do_not_collide():
+    from app.blobs import put_blob, load_blob
+    text_ref = put_blob('{"a": 1}')
+    json_ref = put_blob({"a": 1})
+    assert text_ref != json_ref
+    assert load_blob(text_ref) == '{"a": 1}'
+    assert load_blob(json_ref) == {"a": 1}
+
+def test_arun_graph_loads_blob_state_off_the_loop(monkeypatch):
+    import asyncio
+    import threading
+    from app import blobs
+    from app.engine import SimpleEngine
+
+    ref = blobs.put_blob("x" * 2000)
+    loaded_on = []
+    real_load = blobs.load_blob
+
+    def recording_load(ref_or_key):
+        loaded_on.append(threading.current_thread())
+        return real_load(ref_or_key)
+
+    monkeypatch.setattr(blobs, "load_blob", recording_load)
+
+    async def size(state):
+        return {"size": len(state.get("source"))}
+
+    engine = SimpleEngine({"size": size})
+    try:
+        result = asyncio.run(engine.arun_graph({"nodes": {"s": {"fn": "size"}}, "start": "s"}, blobs.BlobState(source=ref)))
+    finally:
+        engine.shutdown()
+    assert result["state"]["size"] == 2000
+    assert loaded_on and threading.main_thread() not in loaded_on
@@ -0,0 +1,139 @@
+# tests/test_retention.py
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+from app import retention
+from app.db import Base, SessionLocal, engine as app_engine
+from app.models import Blob, Review, Run, RunBlob
+from app.retention import RetentionPolicy, sweep
+
+
+@pytest.fixture(autouse=True)
+def temp_db(tmp_path, monkeypatch):
+    # sweeps are table-wide: never run them against the configured (possibly tracked) DB
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'retention.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=test_engine)
+    monkeypatch.setattr(retention, "engine", test_engine)
+    SessionLocal.configure(bind=test_engine)
+    yield test_engine
+    SessionLocal.configure(bind=app_engine)
+    test_engine.dispose()
+
+
+def _add_review(db, source_hash, age_days):
+    r = Review(
+        source_hash=source_hash,
+        summary="s",
+        findings=[],
+        suggestions=[],
+        created_at=datetime.utcnow() - timedelta(days=age_days),
+    )
+    db.add(r)
+    db.commit()
+    return r.id
+
+
+def _read_archive(tmp_path, table):
+    (archive,) = tmp_path.glob(f"{table}-*.ndjson.gz")
+    with gzip.open(archive, "rt") as fh:
+        return [json.loads(line) for line in fh]
+
+
+def test_sweep_applies_ttl_and_keep_latest_with_archive(tmp_path):
+    db = SessionLocal()
+    try:
+        old = _add_review(db, "retention-a", age_days=400)
+        dupes = [_add_review(db, "retention-b", age_days=d) for d in (4, 3, 2, 1)]
+    finally:
+        db.close()
+
+    archive_dir = tmp_path / "archive"
+    policy = RetentionPolicy(reviews_days=365, keep_latest=2, archive_dir=str(archive_dir), batch_size=1)
+    assert sweep(policy, dry_run=True) == {"reviews_expired": 1, "reviews_superseded": 2}
+    assert sweep(policy) == {"reviews_expired": 1, "reviews_superseded": 2}
+
+    db = SessionLocal()
+    try:
+        assert db.get(Review, old) is None
+        assert db.get(Review, dupes[0]) is None and db.get(Review, dupes[1]) is None
+        assert db.get(Review, dupes[2]) is not None and db.get(Review, dupes[3]) is not None
+    finally:
+        db.close()
+
+    assert sorted(row["id"] for row in _read_archive(archive_dir, "reviews")) == [old, dupes[0], dupes[1]]
+
+
+def test_sweep_keeps_referenced_and_recently_used_blobs():
+    from app.blobs import put_blob, run_blob_keys, set_run_blobs
+    old = datetime.utcnow() - timedelta(days=60)
+    keys = {name: put_blob({"retention-blob": name})["$blob"] for name in ("orphan", "in_run", "reused")}
+    db = SessionLocal()
+    try:
+        for key in keys.values():
+            db.get(Blob, key).created_at = old
+        run = Run(graph_id=1, state="{}", status="done", created_at=old)
+        db.add(run)
+        db.flush()
+        set_run_blobs(db, run.id, run_blob_keys({"review": {"$blob": keys["in_run"]}}))
+        db.commit()
+        run_id = run.id
+    finally:
+        db.close()
+    put_blob({"retention-blob": "reused"})  # stored again: last_used_at is now
+
+    assert sweep(RetentionPolicy(blobs_days=30)) == {"blobs_unreferenced": 1}
+    db = SessionLocal()
+    try:
+        assert db.get(Blob, keys["orphan"]) is None
+        assert db.get(Blob, keys["in_run"]) is not None
+        assert db.get(Blob, keys["reused"]) is not None
+    finally:
+        db.close()
+
+    # deleting the run drops its references, so the blob goes in the same sweep
+    assert sweep(RetentionPolicy(runs_days=30, blobs_days=30)) == {"runs_expired": 1, "blobs_unreferenced": 1}
+    db = SessionLocal()
+    try:
+        assert db.get(Run, run_id) is None
+        assert db.get(RunBlob, (run_id, keys["in_run"])) is None
+        assert db.get(Blob, keys["in_run"]) is None
+    finally:
+        db.close()
+
+
+def test_blob_referenced_during_sweep_is_neither_deleted_nor_archived(tmp_path, monkeypatch):
+    from app.blobs import put_blob
+    old = datetime.utcnow() - timedelta(days=60)
+    keys = [put_blob({"retention-race": n})["$blob"] for n in range(2)]
+    db = SessionLocal()
+    try:
+        for key in keys:
+            db.get(Blob, key).created_at = old
+        db.commit()
+    finally:
+        db.close()
+
+    real_delete_batch = retention._delete_batch
+
+    def delete_batch_after_new_run(db, *args):
+        # a run references keys[0] after the sweep selected it, before the DELETE
+        other = SessionLocal()
+        try:
+            other.add(RunBlob(run_id=99, hash=keys[0]))
+            other.commit()
+        finally:
+            other.close()
+        return real_delete_batch(db, *args)
+
+    monkeypatch.setattr(retention, "_delete_batch", delete_batch_after_new_run)
+    assert sweep(RetentionPolicy(blobs_days=30, archive_dir=str(tmp_path))) == {"blobs_unreferenced": 1}
+    assert [row["hash"] for row in _read_archive(tmp_path, "blobs")] == [keys[1]]
+    db = SessionLocal()
+    try:
+        assert db.get(Blob, keys[0]) is not None
+    finally:
+        db.close()